@@ -0,0 +1,125 @@
+"""Headless FastGolem queries, without going through the Streamlit UI.
+
+Run a query spec (a JSON object) or a batch of specs (a JSON list) from a file or stdin:
+
+    python api.py query specs.json --format csv > results.csv
+
+Or serve them over a local HTTP endpoint, POSTing the same JSON to /query?format=json|csv|arrow:
+
+    python api.py serve --port 8502
+
+See resources/engine.py::run_query for the query spec.
+"""
+import sys
+import json
+import argparse
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from resources.engine import CSV_FILE_PATH, JSON_FILE_PATH, FORMATS, load_dataset, run_batch, format_results
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+def as_batch(payload):
+    """A single query spec or a list of specs, as a list of specs."""
+    return payload if isinstance(payload, list) else [payload]
+
+def make_handler(dataset):
+    """Request handler class answering queries against a shared Dataset."""
+
+    class QueryHandler(BaseHTTPRequestHandler):
+
+        def _send(self, status, body, content_type='application/json'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_error(self, status, message):
+            self._send(status, json.dumps({'error': message}).encode('utf-8'))
+
+        def do_GET(self):
+            if urlparse(self.path).path == '/health':
+                self._send(200, json.dumps({'status': 'ok', 'records': len(dataset.df)}).encode('utf-8'))
+            else:
+                self._send_error(404, 'Not found')
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != '/query':
+                self._send_error(404, 'Not found')
+                return
+            fmt = parse_qs(url.query).get('format', ['json'])[0]
+            if fmt not in FORMATS:
+                self._send_error(400, f"Unknown format {fmt}, expected one of {FORMATS}")
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length))
+                body = format_results(run_batch(dataset, as_batch(payload)), fmt)
+            except ValueError as e:
+                self._send_error(400, str(e))
+                return
+            except Exception as e:
+                logger.exception(f"Error answering {self.path}: {e}")
+                self._send_error(500, f"Internal error: {e}")
+                return
+            self._send(200, body, CONTENT_TYPES[fmt])
+
+        def log_message(self, format, *args):
+            logger.info(f"{self.address_string()} - {format % args}")
+
+    return QueryHandler
+
+def query(args):
+    """Run the specs of a file (or stdin) and write the results to stdout."""
+    source = open(args.specs) if args.specs != '-' else sys.stdin
+    with source:
+        payload = json.load(source)
+    dataset = load_dataset(args.csv, args.json)
+    results = run_batch(dataset, as_batch(payload))
+    sys.stdout.buffer.write(format_results(results, args.format))
+    sys.stdout.buffer.flush()
+
+def serve(args):
+    """Serve queries over HTTP until interrupted."""
+    dataset = load_dataset(args.csv, args.json)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(dataset))
+    logger.info(f"Serving FastGolem queries on http://{args.host}:{args.port}/query")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        server.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Headless FastGolem queries.')
+    parser.add_argument('--csv', default=CSV_FILE_PATH, help='HCP data CSV file')
+    parser.add_argument('--json', default=JSON_FILE_PATH, help='NUCC tree JSON file')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    query_parser = commands.add_parser('query', help='Run query specs and print the results')
+    query_parser.add_argument('specs', nargs='?', default='-', help='JSON file with a spec or a list of specs, - for stdin')
+    query_parser.add_argument('--format', choices=FORMATS, default='json')
+    query_parser.set_defaults(func=query)
+
+    serve_parser = commands.add_parser('serve', help='Serve query specs over a local HTTP endpoint')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8502)
+    serve_parser.set_defaults(func=serve)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,469 @@
+"""Concurrent-user load test of the FastGolem app, against a real `streamlit run` server.
+
+Every scale level starts a server on main.py in a temporary workspace holding a synthetic
+dataset, so nothing under .data is touched, and drives it with one websocket client per
+simulated user, speaking the browser's protocol. Each user repeats a recruiter flow:
+login -> tree selection -> facets -> select rows -> downloads:
+
+    python loadtest.py --records 200000 --users 1 2 4 8 16 --flows 3
+
+For every number of concurrent users it reports the throughput of the one server, the
+rerun latency percentiles seen by the clients, and the server's memory: its RSS once the
+dataset is loaded and warmed up, its peak RSS, and the peak growth per concurrent session,
+which is what each additional recruiter costs on top of the shared dataset.
+
+The clients run in this process and share the machine with the server, but they mostly
+wait on their sockets; use --think to give the users a think time between two steps.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import argparse
+import logging
+import tempfile
+import threading
+import subprocess
+import urllib.request
+import numpy as np
+import pandas as pd
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+# Configure logging
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+MAIN_SCRIPT = os.path.join(APP_DIR, 'main.py')
+TREE_FILE = os.path.join(APP_DIR, '.data', 'nucc_tree.json')
+
+USERNAME = 'loadtest'
+PASSWORD = 'loadtest'
+
+SERVER_OPTIONS = [
+    '--server.headless', 'true',
+    '--server.fileWatcherType', 'none',
+    '--browser.gatherUsageStats', 'false',
+]
+
+FIRST_NAMES = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+               'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Maria', 'Wei']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+              'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Nguyen']
+STATES = ['CA', 'TX', 'FL', 'NY', 'PA', 'IL', 'OH', 'GA', 'NC', 'MI', 'NJ', 'VA', 'WA', 'AZ', 'MA']
+
+def tree_codes(tree):
+    """All (taxon_code, group, classification, specialization) of the NUCC tree."""
+    rows = []
+    for group, group_node in tree.items():
+        for classification, node in group_node.items():
+            if classification == 'value':
+                continue
+            if 'value' in node:
+                rows.append((node['value']['nucc_code'], group, classification, None))
+            for specialization, child in node.items():
+                if specialization != 'value' and 'value' in child:
+                    rows.append((child['value']['nucc_code'], group, classification, specialization))
+    return rows
+
+def generate_hcp_data(records, tree, seed=42):
+    """Synthetic HCP data with the columns of hcp_data.csv."""
+    rng = np.random.default_rng(seed)
+    codes = tree_codes(tree)
+    # A few popular taxonomies hold most of the records, as in the real data
+    weights = rng.pareto(1.5, len(codes)) + 1
+    picked = rng.choice(len(codes), records, p=weights / weights.sum())
+    code, group, classification, specialization = (np.array(col, dtype=object)[picked] for col in zip(*codes))
+    state = rng.choice(STATES, records)
+    county = np.char.add(np.char.add(state.astype(str), ' County '), rng.integers(1, 20, records).astype(str))
+    first = rng.choice(FIRST_NAMES, records)
+    last = rng.choice(LAST_NAMES, records)
+    tenure = rng.integers(0, 45, records).astype(float)
+    tenure[rng.random(records) < 0.1] = np.nan
+    graduation = 2024 - tenure - rng.integers(0, 8, records)
+    enumeration = pd.Timestamp('2005-05-23') + pd.to_timedelta(rng.integers(0, 6900, records), unit='D')
+    updated = enumeration + pd.to_timedelta(rng.integers(0, 3000, records), unit='D')
+    npi = 1000000000 + np.arange(records)
+    return pd.DataFrame({
+        'full_name': np.char.add(np.char.add(first.astype(str), ' '), last.astype(str)),
+        'taxon_code': code,
+        'taxon_state': state,
+        'nucc_group': group,
+        'nucc_classification': classification,
+        'nucc_specialization': specialization,
+        'individual_state': state,
+        'individual_place': np.char.add('City ', rng.integers(1, 50, records).astype(str)),
+        'individual_zip5': rng.integers(10000, 99999, records).astype(str),
+        'individual_county': county,
+        'facility_name': np.char.add('Facility ', rng.integers(1, 5000, records).astype(str)),
+        'facility_place': np.char.add('City ', rng.integers(1, 50, records).astype(str)),
+        'facility_zip5': rng.integers(10000, 99999, records).astype(str),
+        'facility_state': state,
+        'medical_school': np.char.add('Medical School ', rng.integers(1, 150, records).astype(str)),
+        'tenure': tenure,
+        'graduation_year': graduation,
+        'enumeration_date': enumeration.strftime('%Y/%m/%d'),
+        'last_update_date': updated.strftime('%Y/%m/%d'),
+        'gender': rng.choice(['M', 'F'], records),
+        'full_name_other': None,
+        'sole_proprietor': rng.random(records) < 0.2,
+        'npi': npi.astype(str),
+        'npi_replacement': None,
+        'medicare_id': np.where(rng.random(records) < 0.6, np.char.add('M', npi.astype(str)), None),
+        'telehealth': rng.random(records) < 0.3,
+        'medicare_specialty': None,
+        'county_code': rng.integers(1, 200, records).astype(str),
+        'geo_id': rng.integers(1, 99999, records).astype(str),
+        'lat': rng.uniform(25, 49, records),
+        'long': rng.uniform(-124, -67, records),
+        'dni': None,
+    })
+
+def make_workspace(records, seed):
+    """Temporary working directory holding a synthetic .data/hcp_data.csv, the NUCC tree, the images and the secrets."""
+    workspace = tempfile.mkdtemp(prefix='fastgolem-loadtest-')
+    os.makedirs(os.path.join(workspace, '.data'))
+    shutil.copy(TREE_FILE, os.path.join(workspace, '.data', 'nucc_tree.json'))
+    # main.py loads its logo relative to the working directory
+    os.symlink(os.path.join(APP_DIR, 'images'), os.path.join(workspace, 'images'))
+    # and reads the accounts from the st.secrets of the working directory
+    os.makedirs(os.path.join(workspace, '.streamlit'))
+    with open(os.path.join(workspace, '.streamlit', 'secrets.toml'), 'w') as secrets:
+        secrets.write(f'[admin]\n\n[user]\n{USERNAME} = "{PASSWORD}"\n')
+    with open(TREE_FILE) as json_file:
+        tree = json.load(json_file)
+    generate_hcp_data(records, tree, seed).to_csv(os.path.join(workspace, '.data', 'hcp_data.csv'), index=False)
+    return workspace
+
+def current_rss(pid='self'):
+    """Resident set size of a process in bytes, 0 once it has exited."""
+    try:
+        with open(f'/proc/{pid}/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (FileNotFoundError, ProcessLookupError):
+        return 0
+
+class RssSampler(threading.Thread):
+    """Samples the peak RSS of a process while a scale level runs."""
+
+    def __init__(self, pid, interval=0.05):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = current_rss(pid)
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, current_rss(self.pid))
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.peak
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(workspace, timeout):
+    """Start `streamlit run main.py` in the workspace and wait until it is healthy, returning (process, port)."""
+    port = free_port()
+    log = open(os.path.join(workspace, f'server-{port}.log'), 'w')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', MAIN_SCRIPT, '--server.port', str(port), *SERVER_OPTIONS],
+        cwd=workspace, stdout=log, stderr=subprocess.STDOUT,
+    )
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Streamlit server exited with {process.returncode}, see {log.name}")
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=1) as response:
+                if response.status == 200:
+                    return process, port
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f"Streamlit server not healthy after {timeout}s, see {log.name}")
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+class Session:
+    """A browser tab: the websocket to the server, the elements of the last run and the widget values set."""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.elements = []
+        self.values = {}
+        self.pages = {}
+        self.page_script_hash = ''
+
+    async def rerun(self, timeout):
+        """Send the widget values of the displayed widgets and wait for the run (and any st.rerun) to finish."""
+        message = BackMsg()
+        message.rerun_script.page_script_hash = self.page_script_hash
+        displayed = {element.id for _, element in self.elements if hasattr(element, 'id')}
+        message.rerun_script.widget_states.widgets.extend(
+            value for widget_id, value in self.values.items() if widget_id in displayed
+        )
+        await self.websocket.send(message.SerializeToString())
+        # A button click is only sent once, as the browser does
+        self.values = {widget_id: value for widget_id, value in self.values.items() if value.WhichOneof('value') != 'trigger_value'}
+        await asyncio.wait_for(self._receive_run(), timeout)
+
+    async def _receive_run(self):
+        elements = []
+        while True:
+            message = ForwardMsg()
+            message.ParseFromString(await self.websocket.recv())
+            kind = message.WhichOneof('type')
+            if kind == 'new_session':
+                # Every run, including the one of an st.rerun, draws the page anew
+                elements = []
+            elif kind == 'navigation':
+                self.pages = {page.page_name: page.page_script_hash for page in message.navigation.app_pages}
+                self.page_script_hash = message.navigation.page_script_hash
+            elif kind == 'delta' and message.delta.WhichOneof('type') == 'new_element':
+                element_type = message.delta.new_element.WhichOneof('type')
+                elements.append((element_type, getattr(message.delta.new_element, element_type)))
+            elif kind == 'script_finished':
+                if message.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError("Script compilation error")
+                if message.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    break
+        self.elements = elements
+        for element_type, element in elements:
+            if element_type == 'exception' and not element.is_warning:
+                raise RuntimeError(f"{element.type}: {element.message}")
+
+    def widget(self, element_type, label=None, key=None):
+        """The last displayed widget of a type with a label, or with a key (e.g. for dataframes)."""
+        for shown_type, element in reversed(self.elements):
+            if shown_type != element_type:
+                continue
+            if (label is None or element.label == label) and (key is None or element.id.endswith(f'-{key}')):
+                return element
+        raise LookupError(f"No {element_type} {label or key} displayed")
+
+    def texts(self):
+        return [element.body for element_type, element in self.elements if element_type == 'markdown']
+
+    def _set(self, widget, field, value):
+        state = WidgetState(id=widget.id)
+        if field == 'string_array_value':
+            state.string_array_value.data.extend(value)
+        else:
+            setattr(state, field, value)
+        self.values[widget.id] = state
+
+    def select(self, widget, option):
+        """Select an option of a selectbox, as formatted by its format_func."""
+        self._set(widget, 'string_value', option)
+
+    def select_many(self, widget, options):
+        self._set(widget, 'string_array_value', options)
+
+    def check(self, widget, checked=True):
+        self._set(widget, 'bool_value', checked)
+
+    def click(self, widget):
+        self._set(widget, 'trigger_value', True)
+
+    def type(self, widget, text):
+        self._set(widget, 'string_value', text)
+
+    def select_rows(self, widget, rows):
+        self._set(widget, 'string_value', json.dumps({'selection': {'rows': rows, 'columns': [], 'cells': []}}))
+
+def populated_options(widget):
+    """The options of a tree dropdown labelled with a non-zero record count, e.g. 'Nursing Service Providers (1,234)'."""
+    return [option for option in widget.options if option and option.rsplit(' (', 1)[1].rstrip(')') != '0']
+
+def candidate_count(session):
+    """Number of candidates the FastGolem page reports."""
+    for text in session.texts():
+        if text.startswith('Number of possible candidates: '):
+            return int(text.rsplit(' ', 1)[1])
+    return 0
+
+async def recruiter_flow(port, rng, timeout, think=0):
+    """One simulated recruiter session, returning the (step, seconds) of each rerun."""
+    timings = []
+    url = f'ws://127.0.0.1:{port}/_stcore/stream'
+    async with websockets.connect(url, subprotocols=['streamlit'], max_size=None, open_timeout=timeout) as websocket:
+        session = Session(websocket)
+
+        async def step(name):
+            if think:
+                await asyncio.sleep(rng.uniform(0, 2 * think))
+            start = time.perf_counter()
+            try:
+                await session.rerun(timeout)
+            except Exception as e:
+                raise RuntimeError(f"{name}: {type(e).__name__} {e}") from e
+            timings.append((name, time.perf_counter() - start))
+
+        # Login
+        await step('open')
+        session.select(session.widget('selectbox', 'Choose your role'), 'User')
+        await step('role')
+        session.type(session.widget('text_input', 'Username'), USERNAME)
+        session.type(session.widget('text_input', 'Password'), PASSWORD)
+        session.click(session.widget('button', 'Log In'))
+        await step('login')
+
+        # Tree selection, among the nodes holding records as a recruiter would
+        group_selectbox = session.widget('selectbox', 'Select Group')
+        session.select(group_selectbox, rng.choice(populated_options(group_selectbox)))
+        await step('group')
+        classification_selectbox = session.widget('selectbox', 'Select Classification')
+        session.select(classification_selectbox, rng.choice(populated_options(classification_selectbox)))
+        await step('classification')
+
+        # Facets
+        session.select_many(session.widget('multiselect', 'Select Filters to Display'), ['Individual State', 'Telehealth', 'Tenure'])
+        await step('facets')
+        state_selectbox = session.widget('selectbox', 'Select Individual State')
+        states = [option for option in state_selectbox.options if option]
+        if states:
+            session.select(state_selectbox, rng.choice(states))
+            await step('state')
+        session.check(session.widget('checkbox', 'Filter by Telehealth Certification'))
+        await step('telehealth')
+
+        # Select some candidates, then save and download them on the downloads page
+        candidates = candidate_count(session)
+        if candidates:
+            rows = sorted(rng.sample(range(candidates), min(candidates, rng.randint(1, 10))))
+            session.select_rows(session.widget('dataframe', key='combined_editor'), rows)
+            await step('select')
+        session.page_script_hash = session.pages['Downloads']
+        await step('downloads')
+        if candidates:
+            session.select_rows(session.widget('dataframe', key='download_editor'), list(range(len(rows))))
+            await step('download_rows')
+            button = session.widget('download_button', 'Download data as CSV')
+            start = time.perf_counter()
+            with await asyncio.to_thread(urllib.request.urlopen, f'http://127.0.0.1:{port}{button.url}', timeout=timeout) as response:
+                await asyncio.to_thread(response.read)
+            timings.append(('download', time.perf_counter() - start))
+    return timings
+
+async def run_users(port, users, flows, seed, timeout, think):
+    """Run flows recruiter flows for each of users concurrent users, returning their timings and errors."""
+
+    async def user(index):
+        rng = random.Random(seed + index + 1)
+        timings, errors = [], []
+        for _ in range(flows):
+            try:
+                timings.extend(await recruiter_flow(port, rng, timeout, think))
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+        return timings, errors
+
+    results = await asyncio.gather(*(user(index) for index in range(users)))
+    return [timing for timings, _ in results for timing in timings], [error for _, errors in results for error in errors]
+
+def run_level(workspace, users, flows, seed, timeout, think):
+    """Start a fresh server, warm it up with one flow, then run the concurrent users against it."""
+    server, port = start_server(workspace, timeout)
+    errors = []
+    try:
+        # Load the dataset and its caches, as a server would before its first users
+        try:
+            asyncio.run(recruiter_flow(port, random.Random(seed), timeout))
+        except Exception as e:
+            errors.append(f"warm-up {type(e).__name__}: {e}")
+        base = current_rss(server.pid)
+        sampler = RssSampler(server.pid)
+        sampler.start()
+        try:
+            start = time.perf_counter()
+            timings, flow_errors = asyncio.run(run_users(port, users, flows, seed, timeout, think))
+            elapsed = time.perf_counter() - start
+        finally:
+            peak = sampler.stop()
+        errors.extend(flow_errors)
+    finally:
+        stop_server(server)
+
+    completed = users * flows - len(flow_errors)
+    # The download is a plain HTTP fetch, not a rerun
+    reruns = [seconds for step, seconds in timings if step != 'download']
+    latencies = np.array(reruns) if reruns else np.zeros(1)
+    return {
+        'users': users,
+        'flows': completed,
+        'errors': len(errors),
+        'seconds': round(elapsed, 2),
+        'flows_per_s': round(completed / elapsed, 3),
+        'reruns_per_s': round(len(reruns) / elapsed, 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 1),
+        'p90_ms': round(float(np.percentile(latencies, 90)) * 1000, 1),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 1),
+        'max_ms': round(float(latencies.max()) * 1000, 1),
+        'over_1s': int((latencies > 1).sum()),
+        'base_rss_mb': round(base / 1024 ** 2, 1),
+        'peak_rss_mb': round(peak / 1024 ** 2, 1),
+        'session_mb': round(max(peak - base, 0) / users / 1024 ** 2, 2),
+        'first_error': errors[0] if errors else None,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent-user load test of the FastGolem app.')
+    parser.add_argument('--records', type=int, default=100000, help='Records in the synthetic dataset')
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 2, 4, 8], help='Concurrent users of each scale level')
+    parser.add_argument('--flows', type=int, default=2, help='Recruiter flows run by each user')
+    parser.add_argument('--think', type=float, default=0, help='Mean seconds a user waits before each step')
+    parser.add_argument('--timeout', type=float, default=120, help='Seconds a single rerun may take')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    parser.add_argument('--keep', action='store_true', help='Keep the temporary workspace')
+    args = parser.parse_args(argv)
+
+    print(f"Generating {args.records} synthetic records", file=sys.stderr)
+    workspace = make_workspace(args.records, args.seed)
+    cwd = os.getcwd()
+    os.chdir(workspace)
+    sys.path.insert(0, APP_DIR)
+    try:
+        # Write the dataset snapshot once, so every server loads it instead of the CSV
+        from resources.engine import load_dataset
+        load_dataset()
+        results = []
+        for users in args.users:
+            print(f"Running {users} concurrent users against one server on {os.cpu_count()} CPUs", file=sys.stderr)
+            results.append(run_level(workspace, users, args.flows, args.seed, args.timeout, args.think))
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    columns = ['users', 'flows', 'errors', 'seconds', 'flows_per_s', 'reruns_per_s', 'p50_ms', 'p90_ms', 'p99_ms',
+               'max_ms', 'over_1s', 'base_rss_mb', 'peak_rss_mb', 'session_mb']
+    print(pd.DataFrame(results)[columns].to_string(index=False))
+    for result in results:
+        if result['first_error']:
+            print(f"{result['users']} users, first error: {result['first_error']}", file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'records': args.records, 'results': results}, output, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import streamlit as st
 import logging
 import os
+from utils.session_memory import track_session, release_session
 
 # Logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -31,6 +32,9 @@ st.set_page_config(
 if "role" not in st.session_state:
     st.session_state.role = None
 
+# Account for the memory held by this session and evict idle ones
+track_session()
+
 # # Session state for file upload
 # if "file_uploaded" not in st.session_state:
 #     st.session_state.file_uploaded = False
@@ -105,14 +109,13 @@ def logout():
     st.session_state.user = None
     st.session_state.role = None
     st.session_state.file_uploaded = False
-    st.session_state.df = None
-    st.session_state.selection =  None
+    release_session(st.session_state)
     st.rerun()
 
 role = st.session_state.role
 
 logout_page =  st.Page(logout, title="log out", icon=":material/logout:")
-settings =  st.Page("settings.py", title="Settings", icon=":material/settings:")
+settings =  st.Page("settings.py", title="Settings", icon=":material/settings:", default=(role == "Admin"))
 
 resources_account = st.Page(
     "resources/account.py",
@@ -126,6 +129,12 @@ resources_download = st.Page(
     icon=":material/download:",
 )
 
+resources_analytics = st.Page(
+    "resources/analytics.py",
+    title="Analytics",
+    icon=":material/analytics:",
+)
+
 resources_fastgolem = st.Page(
     "resources/fastgolem.py",
     title="FastGolem",
@@ -146,7 +155,7 @@ website_wwa = st.Page(
 )
 
 account_pages = [logout_page, settings]
-resources_pages = [resources_account, resources_fastgolem, resources_download]
+resources_pages = [resources_account, resources_fastgolem, resources_analytics, resources_download]
 website_pages = [website_home, website_wwa]
 
 
@@ -0,0 +1,72 @@
+import streamlit as st
+import logging
+from resources.cube import slice_cube
+from resources.engine import CSV_FILE_PATH, JSON_FILE_PATH
+from utils.dataset import get_dataset
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+st.header("Candidate Analytics", divider='orange')
+
+dataset = get_dataset()
+tree_dict = dataset.tree
+if not tree_dict:
+    st.error(f"Error loading JSON file {JSON_FILE_PATH}")
+if dataset.df.empty:
+    st.error(f"Error loading CSV file {CSV_FILE_PATH}")
+if not tree_dict or dataset.df.empty:
+    st.stop()
+cube = dataset.cube
+node_counts = dataset.node_counts
+
+def format_node(*path):
+    """Label the options of a tree dropdown with their rolled-up record count"""
+    return lambda option: f"{option} ({node_counts.get(path + (option,), 0):,})" if option else 'All'
+
+def children(*path):
+    """Child nodes of the node at path"""
+    node = tree_dict
+    for key in path:
+        node = node[key]
+    return sorted(key for key in node if key != 'value')
+
+# Sidebar for the taxonomy node to analyse
+st.sidebar.title('Analytics')
+path = ()
+selected_group = st.sidebar.selectbox('Select Group', [''] + children(), format_func=format_node(), key='analytics_group')
+if selected_group:
+    path = (selected_group,)
+    selected_classification = st.sidebar.selectbox('Select Classification', [''] + children(*path), format_func=format_node(*path), key='analytics_classification')
+    if selected_classification:
+        path = path + (selected_classification,)
+        selected_specialization = st.sidebar.selectbox('Select Specialization', [''] + children(*path), format_func=format_node(*path), key='analytics_specialization')
+        if selected_specialization:
+            path = path + (selected_specialization,)
+
+# Geography and breakdown of the counts
+geographies = {'State': 'individual_state', 'County': 'individual_county'}
+breakdowns = {'None': None, 'Telehealth': 'telehealth', 'Gender': 'gender', 'Medicare': 'medicare'}
+geography = st.sidebar.selectbox('Count per', list(geographies))
+breakdown = st.sidebar.selectbox('Break down by', list(breakdowns))
+
+filters = {}
+if geography == 'County':
+    states = sorted(cube['individual_state'].dropna().unique())
+    selected_state = st.sidebar.selectbox('Select Individual State', [''] + list(states))
+    if selected_state:
+        filters['individual_state'] = selected_state
+
+counts = slice_cube(cube, path, geographies[geography], breakdowns[breakdown], filters)
+logger.info(f"Cube sliced on {path} per {geography} by {breakdown}")
+
+st.write(f"{' > '.join(path) if path else 'All practitioners'}: {int(counts['Total'].sum()):,} records")
+st.dataframe(counts)
+
+# Chart the 25 largest, labelling counties with their state
+chart_data = counts.head(25)
+if breakdowns[breakdown]:
+    chart_data = chart_data.drop(columns='Total')
+chart_data.index = [', '.join(map(str, reversed(key))) if isinstance(key, tuple) else str(key) for key in chart_data.index]
+st.bar_chart(chart_data)
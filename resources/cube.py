@@ -0,0 +1,94 @@
+import logging
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+LEVELS = ['Group', 'Classification', 'Specialization']
+
+# Dimensions the counts are crossed with, medicare being whether medicare_id is set
+DIMENSIONS = ['individual_state', 'individual_county', 'telehealth', 'gender', 'medicare']
+
+def tree_paths(tree):
+    """One row per NUCC node with a code: its taxon_code and its Group, Classification, Specialization."""
+    rows = []
+    stack = [(node, [group]) for group, node in tree.items()]
+    while stack:
+        node, path = stack.pop()
+        if 'value' in node:
+            rows.append([node['value'].get('nucc_code', 'null')] + path + [None] * (len(LEVELS) - len(path)))
+        stack.extend((child, path + [key]) for key, child in node.items() if key != 'value' and isinstance(child, dict))
+    return pd.DataFrame(rows, columns=['taxon_code'] + LEVELS)
+
+def build_cube(df, tree):
+    """Record counts per NUCC node, at every level of the tree, crossed with DIMENSIONS.
+
+    A node counts the records of its own code and of all codes below it, as the tree filter
+    of the FastGolem page does. Deeper levels of a node are None, e.g. a Group row has no
+    Classification and Specialization. Without data the cube is empty.
+    """
+    columns = ['Level'] + LEVELS + DIMENSIONS + ['count']
+    if df.empty or 'taxon_code' not in df.columns or not tree:
+        # No data was loaded, the cube has no cells and every node a count of 0
+        logger.warning("No HCP data or NUCC tree to build the cube from")
+        return pd.DataFrame({col: pd.Series(dtype='int64' if col == 'count' else object) for col in columns})
+    logger.info(f"Building taxonomy x geography cube over {len(df)} records")
+    dimensions = DIMENSIONS
+    base = pd.DataFrame({
+        'taxon_code': df['taxon_code'],
+        'individual_state': df['individual_state'],
+        'individual_county': df['individual_county'],
+        'telehealth': df['telehealth'],
+        'gender': df['gender'],
+        'medicare': df['medicare_id'].notna(),
+    })
+    base = base.groupby(['taxon_code'] + dimensions, dropna=False).size().rename('count').reset_index()
+    base = tree_paths(tree).merge(base, on='taxon_code')
+
+    levels = []
+    for depth, level in enumerate(LEVELS, 1):
+        keys = LEVELS[:depth]
+        rows = base.dropna(subset=[level]).groupby(keys + dimensions, dropna=False)['count'].sum().reset_index()
+        for deeper in LEVELS[depth:]:
+            rows[deeper] = None
+        rows.insert(0, 'Level', level)
+        levels.append(rows)
+    cube = pd.concat(levels, ignore_index=True)[columns]
+    for col in ['Level'] + LEVELS + ['individual_state', 'individual_county', 'gender']:
+        cube[col] = cube[col].astype('category')
+    logger.info(f"Cube built with {len(cube)} cells")
+    return cube
+
+def node_counts(cube):
+    """Rolled-up record count of every node, keyed by its path tuple, e.g. (group, classification)."""
+    counts = {}
+    for depth, level in enumerate(LEVELS, 1):
+        rows = cube[cube['Level'] == level]
+        totals = rows.groupby(LEVELS[:depth], observed=True)['count'].sum()
+        for path, count in totals.items():
+            counts[path if isinstance(path, tuple) else (path,)] = int(count)
+    return counts
+
+def slice_cube(cube, path=(), by='individual_state', breakdown=None, filters=None):
+    """Counts of the node at path (all records when empty) per value of by, split by breakdown.
+
+    filters restricts dimensions to a value, e.g. {'individual_state': 'CA'}. Counties are
+    reported with their state, as county names repeat across states.
+    """
+    level = LEVELS[len(path) - 1] if path else LEVELS[0]
+    rows = cube[cube['Level'] == level]
+    for key, value in zip(LEVELS, path):
+        rows = rows[rows[key] == value]
+    for dimension, value in (filters or {}).items():
+        rows = rows[rows[dimension] == value]
+    index = ['individual_state', 'individual_county'] if by == 'individual_county' else [by]
+    columns = [breakdown] if breakdown else []
+    counts = rows.groupby(index + columns, observed=True, dropna=False)['count'].sum()
+    if breakdown:
+        counts = counts.unstack(breakdown, fill_value=0)
+        counts.columns = counts.columns.astype(str)
+        counts['Total'] = counts.sum(axis=1)
+    else:
+        counts = counts.to_frame('Total')
+    return counts.sort_values('Total', ascending=False)
@@ -1,3 +1,6 @@
+import os
+import tempfile
+import numpy as np
 import pandas as pd
 import json
 import logging
@@ -29,24 +32,104 @@ def load_json(file_path):
         logger.error(f"Error loading JSON file {file_path}: {e}")
         return {}
 
-def parse_tree(node, path=[]):
-    """Parse the n-ary tree into a flat structure."""
+def parse_tree(node, path=None):
+    """Parse the n-ary tree into a flat structure, walking it iteratively in document order."""
     rows = []
-    if 'value' in node:
-        rows.append({
-            'Group': path[0] if len(path) > 0 else None,
-            'Classification': path[1] if len(path) > 1 else None,
-            'Specialization': path[2] if len(path) > 2 else None,
-            'NUCC Code': node['value'].get('nucc_code', None),
-            'NUCC Definition': node['value'].get('nucc_definition', None)
-        })
-    for key, child in node.items():
-        if key != 'value':
-            rows.extend(parse_tree(child, path + [key]))
-            # logger.info(f"Parsed Tree Structure: {rows}")
+    stack = [(node, tuple(path or ()))]
+    while stack:
+        node, path = stack.pop()
+        if 'value' in node:
+            rows.append({
+                'Group': path[0] if len(path) > 0 else None,
+                'Classification': path[1] if len(path) > 1 else None,
+                'Specialization': path[2] if len(path) > 2 else None,
+                'NUCC Code': node['value'].get('nucc_code', None),
+                'NUCC Definition': node['value'].get('nucc_definition', None)
+            })
+        children = [(child, path + (key,)) for key, child in node.items() if key != 'value']
+        stack.extend(reversed(children))
     return rows
 
+def build_taxonomy_table(nary_tree):
+    """Flatten the NUCC tree into a lookup table indexed by taxon id, one row per NUCC code.
 
+    Besides the Group, Classification, Specialization, NUCC Code and NUCC Definition of
+    parse_tree, it holds group_id and classification_id, the ids of the tree path of the code.
+    """
+    table = pd.DataFrame(parse_tree(nary_tree), columns=['Group', 'Classification', 'Specialization', 'NUCC Code', 'NUCC Definition'])
+    table = table.dropna(subset=['NUCC Code']).drop_duplicates(subset=['NUCC Code']).reset_index(drop=True)
+    table['group_id'] = pd.factorize(table['Group'])[0].astype(np.int32)
+    table['classification_id'] = pd.factorize(pd.MultiIndex.from_frame(table[['Group', 'Classification']]))[0].astype(np.int32)
+    table.index.name = 'taxon_id'
+    logger.info(f"Taxonomy table built with {len(table)} codes")
+    return table
+
+def enrich_hcp(df, taxonomy):
+    """Attach taxon_id, tree path ids and NUCC definition to the HCP rows with one join on taxon_code.
+
+    taxon_id is the row of taxonomy of the code, -1 when the code is not in the tree, so any
+    taxonomy lookup is then an array index.
+    """
+    if df.empty:
+        return df
+    taxon_id = pd.Index(taxonomy['NUCC Code']).get_indexer(df['taxon_code']).astype(np.int32)
+    known = taxon_id >= 0
+    df = df.copy(deep=False)
+    df['taxon_id'] = taxon_id
+    # Every lookup gets an extra last slot of -1, looked up by the taxon_id -1 of unknown
+    # codes, so an empty taxonomy (e.g. an unreadable NUCC tree) is looked up safely too
+    for col in ['group_id', 'classification_id']:
+        df[col] = np.append(taxonomy[col].to_numpy(), -1)[taxon_id].astype(np.int32)
+    # Definitions are shared by many rows, so they are stored once as categories
+    definition_codes, definitions = pd.factorize(taxonomy['NUCC Definition'])
+    df['nucc_definition'] = pd.Categorical.from_codes(np.append(definition_codes, -1)[taxon_id], definitions)
+    logger.info(f"Enriched {len(df)} records, {int((~known).sum())} with a code outside the NUCC tree")
+    return df
+
+# Bump whenever the ingest changes what the snapshot holds (dtypes, parsed columns, enrichment, cube, name index)
+SNAPSHOT_VERSION = 2
+
+def snapshot_path(csv_path):
+    """Path of the enriched snapshot cached next to the CSV data."""
+    return os.path.splitext(csv_path)[0] + '.enriched.pkl'
+
+def _source_stamp(*paths):
+    """What a snapshot was built from: the ingest version, the pandas version and the source files."""
+    return [SNAPSHOT_VERSION, pd.__version__] + [(os.path.getmtime(path), os.path.getsize(path)) for path in paths]
+
+def load_snapshot(csv_path, json_path):
+    """The (enriched HCP frame, taxonomy table, count cube, name index) cached for these sources, or None when missing or stale."""
+    path = snapshot_path(csv_path)
+    try:
+        snapshot = pd.read_pickle(path)
+        if snapshot['sources'] != _source_stamp(csv_path, json_path):
+            logger.info(f"Snapshot {path} is stale")
+            return None
+        logger.info(f"Snapshot {path} loaded with {len(snapshot['hcp'])} records")
+        return snapshot['hcp'], snapshot['taxonomy'], snapshot['cube'], snapshot['name_index']
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Error loading snapshot {path}: {e}")
+        return None
+
+def save_snapshot(csv_path, json_path, df, taxonomy, cube=None, name_index=None):
+    """Cache the enriched HCP frame, taxonomy table, count cube and name index next to the CSV data.
+
+    The snapshot is written to a temporary file first and moved into place, so a process
+    loading it (e.g. api.py next to the Streamlit app) never reads a partial one.
+    """
+    path = snapshot_path(csv_path)
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    try:
+        pd.to_pickle({'sources': _source_stamp(csv_path, json_path), 'hcp': df, 'taxonomy': taxonomy, 'cube': cube, 'name_index': name_index}, temp_path)
+        os.replace(temp_path, path)
+        logger.info(f"Snapshot {path} saved")
+    except Exception as e:
+        logger.error(f"Error saving snapshot {path}: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
 
 def generate_dataframes(csv_path, json_path):
     # Define the column data types explicitly if known
@@ -88,13 +171,9 @@ def generate_dataframes(csv_path, json_path):
     df_csv = load_csv(csv_path, dtype)
     nary_tree = load_json(json_path)
 
-    parsed_data = []
-    for group, group_data in nary_tree.items():
-        parsed_data.extend(parse_tree(group_data, [group]))
-
-    df_nary_tree = pd.DataFrame(parsed_data)
+    df_nary_tree = build_taxonomy_table(nary_tree)
     
-    return df_csv, df_nary_tree
+    return enrich_hcp(df_csv, df_nary_tree), df_nary_tree
 
 if __name__ == "__main__":
     csv_path = 'data/hcp.csv'
@@ -29,14 +29,14 @@ if 'user_data' not in st.session_state:
 
 user_id = st.session_state['user']['username']
 
+if user_id not in st.session_state['user_data']:
+    st.session_state['user_data'][user_id] = pd.DataFrame()
+
 # Save the selected data to the user-specific dataframe
 if not st.session_state['selected_data'].empty:
     selected_data = st.session_state['selected_data']
 
     # Save the data to the user-specific dataframe tagged with username
-    if user_id not in st.session_state['user_data']:
-        st.session_state['user_data'][user_id] = pd.DataFrame()
-
     st.session_state['user_data'][user_id] = pd.concat([st.session_state['user_data'][user_id], selected_data]).drop_duplicates().reset_index(drop=True)
     
 else:
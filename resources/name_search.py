@@ -0,0 +1,180 @@
+import re
+import logging
+import numpy as np
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+NAME_COLUMNS = ['full_name', 'full_name_other']
+
+# Most distinct candidate names a query scores, larger blocks (e.g. a common surname alone) are rejected
+MAX_SCORED_NAMES = 20000
+
+_SOUNDEX_DIGITS = str.maketrans('bfpvcgjkqsxzdtlmnr', '111122222222334556')
+
+def normalize_name(names):
+    """Lowercase a Series of names and reduce them to space separated letter tokens."""
+    return (
+        names.str.lower()
+        .str.replace("'", '', regex=False)
+        .str.replace(r'[^a-z]+', ' ', regex=True)
+        .str.strip()
+        .replace('', np.nan)
+    )
+
+def soundex(token):
+    """American Soundex code of a single name token, e.g. 'smith' -> 'S530'."""
+    token = re.sub(r'[^a-z]', '', token.lower())
+    if not token:
+        return ''
+    digits = token.translate(_SOUNDEX_DIGITS)
+    code = []
+    previous = digits[0]
+    for letter, digit in zip(token[1:], digits[1:]):
+        if digit.isdigit():
+            if digit != previous:
+                code.append(digit)
+            previous = digit
+        elif letter not in 'hw':
+            # Vowels separate repeated codes, 'h' and 'w' do not
+            previous = ''
+    return (token[0].upper() + ''.join(code) + '000')[:4]
+
+def sorted_token_key(name):
+    """Order-insensitive key of a normalized name, e.g. 'smith john' -> 'john smith'."""
+    return ' '.join(sorted(name.split()))
+
+def _pair_key(first, last):
+    return 'P:' + '|'.join(sorted([first, last]))
+
+def query_keys(name):
+    """Blocking keys a query name is looked up under."""
+    tokens = normalize_name(pd.Series([name], dtype=object)).dropna()
+    if tokens.empty:
+        return []
+    tokens = tokens.iloc[0].split()
+    if len(tokens) == 1:
+        return ['T:' + soundex(tokens[0])]
+    return [_pair_key(soundex(tokens[0]), soundex(tokens[-1])), 'S:' + sorted_token_key(' '.join(tokens))]
+
+def _blocking_keys(normalized):
+    """Long frame of (key, row) pairs for a Series of normalized names."""
+    normalized = normalized.dropna()
+    tokens = normalized.str.split()
+    first = tokens.str[0]
+    last = tokens.str[-1]
+    # Soundex is computed once per distinct token rather than once per row
+    codes = {token: soundex(token) for token in pd.unique(pd.concat([first, last]))}
+    first_code = first.map(codes).astype(object)
+    last_code = last.map(codes).astype(object)
+    multi_token = tokens.str.len() > 1
+
+    pairs = pd.Series(
+        np.where(first_code <= last_code, first_code + '|' + last_code, last_code + '|' + first_code),
+        index=normalized.index,
+    )
+    keys = [
+        'P:' + pairs[multi_token],
+        'S:' + tokens.map(lambda t: ' '.join(sorted(t))).astype(object),
+        'T:' + first_code,
+        'T:' + last_code[multi_token],
+    ]
+    return pd.concat([k.rename('key').reset_index() for k in keys], ignore_index=True)
+
+def build_name_index(df, columns=NAME_COLUMNS):
+    """Build the blocking index used by fuzzy_name_search over the name columns of df."""
+    logger.info(f"Building name blocking index over {len(df)} records")
+    columns = [col for col in columns if col in df.columns]
+    names = {}
+    blocks = []
+    for col in columns:
+        normalized = normalize_name(df[col].astype(object)).astype(object)
+        names[col] = normalized.to_numpy()
+        blocks.append(_blocking_keys(normalized))
+
+    if blocks:
+        blocks = pd.concat(blocks, ignore_index=True)
+    else:
+        blocks = pd.DataFrame({'index': [], 'key': []})
+    blocks.columns = ['row', 'key']
+    # Rows are stored as positions in df, grouped contiguously by key
+    blocks['row'] = df.index.get_indexer(blocks['row'])
+    blocks = blocks.drop_duplicates()
+    codes, keys = pd.factorize(blocks['key'])
+    order = np.argsort(codes, kind='stable')
+    offsets = np.searchsorted(codes[order], np.arange(len(keys) + 1))
+    logger.info(f"Name blocking index built with {len(keys)} blocks")
+    return {
+        'labels': df.index,
+        'keys': pd.Index(keys),
+        'offsets': offsets,
+        'rows': blocks['row'].to_numpy()[order],
+        'names': names,
+    }
+
+def candidate_rows(index, name):
+    """Positions of the rows sharing at least one blocking key with name."""
+    found = index['keys'].get_indexer(query_keys(name))
+    rows = [index['rows'][index['offsets'][i]:index['offsets'][i + 1]] for i in found if i >= 0]
+    if not rows:
+        return np.array([], dtype=np.intp)
+    return np.unique(np.concatenate(rows))
+
+def levenshtein(a, b):
+    """Edit distance between two strings."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+def name_similarity(query, name):
+    """Similarity in [0, 1] of two normalized names, ignoring token order."""
+    if not isinstance(name, str) or not name:
+        return 0.0
+    if ' ' not in query:
+        # A single token query is matched against the closest token of the name
+        pairs = [(query, token) for token in name.split()]
+    else:
+        pairs = [(query, name), (sorted_token_key(query), sorted_token_key(name))]
+    best = 0.0
+    for a, b in pairs:
+        best = max(best, 1 - levenshtein(a, b) / max(len(a), len(b)))
+    return best
+
+def fuzzy_name_search(df, index, name, k=50, min_score=0.6):
+    """Top-k rows of df ranked by similarity to name, with the score in a name_score column.
+
+    df may be any subset of the frame the index was built on, so the search composes with
+    the taxonomy and facet filters applied before it. Each distinct candidate name is scored
+    once, and a ValueError is raised when the candidates hold more than MAX_SCORED_NAMES.
+    """
+    query = normalize_name(pd.Series([name], dtype=object)).iloc[0]
+    if not isinstance(query, str):
+        return df.iloc[0:0].assign(name_score=pd.Series(dtype=float))
+
+    positions = candidate_rows(index, name)
+    positions = positions[index['labels'][positions].isin(df.index)]
+    # Rows of a block mostly repeat a few names, so they are scored per distinct name
+    factorized = [pd.factorize(names[positions]) for names in index['names'].values()]
+    distinct = sum(len(uniques) for _, uniques in factorized)
+    logger.info(f"Fuzzy name search for '{name}' scoring {distinct} names of {len(positions)} candidates")
+    if distinct > MAX_SCORED_NAMES:
+        raise ValueError(f"'{name}' matches {distinct} distinct names, narrow the search with a full name or other filters")
+
+    scores = np.zeros(len(positions))
+    for codes, uniques in factorized:
+        name_scores = np.fromiter((name_similarity(query, n) for n in uniques), dtype=float, count=len(uniques))
+        # Missing names have code -1, which looks up the 0 appended last
+        scores = np.maximum(scores, np.append(name_scores, 0.0)[codes])
+
+    keep = scores >= min_score
+    labels = index['labels'][positions[keep]]
+    result = df.loc[labels].assign(name_score=scores[keep].round(3))
+    return result.sort_values('name_score', ascending=False, kind='stable').head(k)
@@ -1,4 +1,16 @@
 import streamlit as st
+from utils.session_memory import SESSION_CAP_BYTES, SESSION_IDLE_SECONDS, session_memory_report
 
 st.header("Settings")
-st.write(f"You are logged in as {st.session_state.role}")
\ No newline at end of file
+st.write(f"You are logged in as {st.session_state.role}")
+
+if st.session_state.role == "Admin":
+    st.subheader("Session Memory")
+    report = session_memory_report()
+    total = int(report['Total (bytes)'].sum()) if not report.empty else 0
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Sessions", len(report))
+    col2.metric("Held by sessions (MB)", f"{total / 1024 ** 2:.1f}")
+    col3.metric("Cap (MB)", f"{SESSION_CAP_BYTES / 1024 ** 2:.0f}")
+    st.caption(f"Heavy objects of sessions idle for more than {SESSION_IDLE_SECONDS // 60} minutes are evicted.")
+    st.dataframe(report, hide_index=True)
@@ -0,0 +1,17 @@
+import streamlit as st
+import logging
+from resources.engine import CSV_FILE_PATH, JSON_FILE_PATH, load_dataset
+from utils.session_memory import mark_shared
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Caching the loading of the dataset, shared by every session and page
+@st.cache_resource
+def get_dataset(csv_path=CSV_FILE_PATH, json_path=JSON_FILE_PATH):
+    logger.info(f"Initiating get_dataset function")
+    dataset = load_dataset(csv_path, json_path)
+    # The dataset is not charged to the sessions holding it in session_state
+    mark_shared(dataset.df)
+    return dataset
@@ -0,0 +1,175 @@
+import os
+import sys
+import time
+import logging
+import threading
+import weakref
+import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Total bytes all sessions may hold before the least recently seen ones are evicted
+SESSION_CAP_BYTES = int(float(os.environ.get('FASTGOLEM_SESSION_CAP_MB', 1024)) * 1024 ** 2)
+# Seconds without a rerun after which a session's heavy objects are evicted
+SESSION_IDLE_SECONDS = int(float(os.environ.get('FASTGOLEM_SESSION_IDLE_MINUTES', 30)) * 60)
+# Seconds a session must have been idle before the cap may evict it, so no rerun is cut short
+SESSION_CAP_MIN_IDLE_SECONDS = int(float(os.environ.get('FASTGOLEM_SESSION_CAP_MIN_IDLE_MINUTES', 2)) * 60)
+# Seconds between two sweeps of the sessions, which evict even when no session reruns
+SESSION_SWEEP_SECONDS = 60
+# Seconds after which an evicted session is no longer reported
+SESSION_FORGET_SECONDS = 24 * 60 * 60
+
+# Keys always evicted, and keys never evicted whatever their size
+HEAVY_KEYS = ['df', 'selected_data', 'user_data']
+LIGHT_KEYS = ['role', 'user', 'username', 'file_uploaded']
+# Any other key (e.g. widget payloads) holding at least this many bytes is evicted too
+HEAVY_KEY_BYTES = 1024 ** 2
+# Key of the _SessionHandle each tracked session holds in its own state
+HANDLE_KEY = '_session_memory_handle'
+
+_sessions = {}
+_shared = weakref.WeakValueDictionary()
+_lock = threading.Lock()
+_sweeper = None
+
+class _SessionHandle:
+    """Kept in a session's own state and only weakly referenced here, so it dies with the session.
+
+    Streamlit wraps the session state anew for every rerun, the handle holds the latest wrapper.
+    """
+
+    def __init__(self, state):
+        self.state = state
+
+def mark_shared(obj):
+    """Register an object shared by all sessions (e.g. the cached dataset) so it is not charged to any of them."""
+    _shared[id(obj)] = obj
+
+def object_bytes(obj):
+    """Approximate number of bytes held by a session_state value."""
+    if _shared.get(id(obj)) is obj:
+        return 0
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(object_bytes(k) + object_bytes(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(object_bytes(v) for v in obj)
+    return sys.getsizeof(obj)
+
+def _is_heavy(key, size):
+    return key not in LIGHT_KEYS and (key in HEAVY_KEYS or size >= HEAVY_KEY_BYTES)
+
+def _evict(session_id, reason):
+    """Drop the heavy objects of a session, keeping its lightweight state. Expects _lock to be held."""
+    session = _sessions[session_id]
+    handle = session['handle']()
+    if handle is None:
+        return
+    evicted = [key for key, size in session['bytes'].items() if _is_heavy(key, size)]
+    for key in evicted:
+        try:
+            del handle.state[key]
+        except KeyError:
+            pass
+        del session['bytes'][key]
+    session['evicted'] = True
+    if evicted:
+        logger.info(f"Evicted {evicted} from session {session_id} ({reason})")
+
+def track_session():
+    """Record the memory held by the current session, and start the sweeper of this process."""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    start_sweeper()
+    session_state = ctx.session_state
+    if HANDLE_KEY not in session_state:
+        session_state[HANDLE_KEY] = _SessionHandle(session_state)
+    handle = session_state[HANDLE_KEY]
+    handle.state = session_state
+    state = session_state.filtered_state
+    usage = {key: object_bytes(value) for key, value in state.items() if key != HANDLE_KEY}
+    user = state.get('user') or {}
+    with _lock:
+        _sessions[ctx.session_id] = {
+            'handle': weakref.ref(handle),
+            'username': user.get('username') if isinstance(user, dict) else None,
+            'last_seen': time.time(),
+            'bytes': usage,
+            'evicted': False,
+        }
+
+def sweep_sessions(now=None):
+    """Forget closed sessions, evict idle ones and enforce the cap."""
+    now = time.time() if now is None else now
+    with _lock:
+        for session_id, session in list(_sessions.items()):
+            idle = now - session['last_seen']
+            if session['handle']() is None:
+                # Closed by Streamlit, along with its state
+                del _sessions[session_id]
+            elif session['evicted'] and idle > SESSION_FORGET_SECONDS:
+                del _sessions[session_id]
+            elif not session['evicted'] and idle > SESSION_IDLE_SECONDS:
+                _evict(session_id, f"idle for {int(idle)}s")
+
+        total = sum(sum(session['bytes'].values()) for session in _sessions.values())
+        if total > SESSION_CAP_BYTES:
+            # Least recently seen first, only sessions idle long enough not to be mid-rerun
+            for session_id in sorted(_sessions, key=lambda s: _sessions[s]['last_seen']):
+                if total <= SESSION_CAP_BYTES:
+                    break
+                if now - _sessions[session_id]['last_seen'] < SESSION_CAP_MIN_IDLE_SECONDS:
+                    break
+                before = sum(_sessions[session_id]['bytes'].values())
+                _evict(session_id, f"sessions hold {total} bytes, cap is {SESSION_CAP_BYTES}")
+                total -= before - sum(_sessions[session_id]['bytes'].values())
+            if total > SESSION_CAP_BYTES:
+                logger.warning(f"Sessions hold {total} bytes, above the cap of {SESSION_CAP_BYTES}")
+
+def _sweep_forever():
+    while True:
+        time.sleep(SESSION_SWEEP_SECONDS)
+        try:
+            sweep_sessions()
+        except Exception as e:
+            logger.error(f"Error sweeping sessions: {e}")
+
+def start_sweeper():
+    """Start the daemon thread sweeping sessions every SESSION_SWEEP_SECONDS, once per process."""
+    global _sweeper
+    with _lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_forever, name='session-memory-sweeper', daemon=True)
+            _sweeper.start()
+
+def release_session(session_state):
+    """Drop the heavy objects of a session, e.g. on logout."""
+    for key in HEAVY_KEYS:
+        if key in session_state:
+            del session_state[key]
+
+def session_memory_report():
+    """One row per tracked session with its bytes per session_state key."""
+    now = time.time()
+    with _lock:
+        rows = [
+            {
+                'Session': session_id[:8],
+                'User': session['username'],
+                'Idle (min)': round((now - session['last_seen']) / 60, 1),
+                'Evicted': session['evicted'],
+                'Total (bytes)': sum(session['bytes'].values()),
+                **session['bytes'],
+            }
+            for session_id, session in _sessions.items()
+        ]
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(rows).sort_values('Total (bytes)', ascending=False).reset_index(drop=True)